@@ -14,63 +14,139 @@ The script will output the citation sources for each citation and show how many
 If no URL is provided as a command-line argument, the script will prompt you to enter the URL interactively.
 """
 
+import re
 import sys
+import codecs
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.etree
+import lxml.html
+from urllib.parse import urljoin
 import collections
+from array import array
+
+USER_AGENT = 'grokipedia-citation-analyzer'
+
+# Shared session so connections to the same host are reused across requests
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.3))
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+SESSION.headers['User-Agent'] = USER_AGENT
+
+# Host part of an http(s) URL, skipping any user:password@ prefix and the port;
+# bracketed IPv6 literals such as [::1] are kept whole
+_DOMAIN_RE = re.compile(r'^https?://(?:[^/?#@]*@)?(\[[^\]/?#]+\]|[^/?#:\[]+)', re.I)
+# charset declared by <meta charset=...> or <meta http-equiv=... content="...; charset=...">
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_.:-]+)', re.I)
+_XML_DECL_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def header_charset(resp):
+    """Return the charset declared in a response's Content-Type header, or None."""
+    # resp.encoding falls back to ISO-8859-1 for text/* without a charset (RFC 2616),
+    # which would override the page's own <meta charset>, so only trust it when declared
+    if 'charset=' in resp.headers.get('Content-Type', '').lower():
+        return resp.encoding
+    return None
+
+
+def document_charset(body, declared=None):
+    """Pick the encoding of an HTML body: the header charset, then <meta charset>, then UTF-8."""
+    candidates = [declared]
+    m = _META_CHARSET_RE.search(body[:2048])
+    if m:
+        candidates.append(m.group(1).decode('ascii'))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return 'utf-8'
+
+
+def decode_html(body, declared=None):
+    """Decode an HTML body to str using the encoding the server or page declares."""
+    # Decode in Python: libxml2 doesn't know several of Python's codec names (euc_kr, mac-roman, ...)
+    text = body.decode(document_charset(body, declared), errors='replace')
+    # lxml refuses str input that still carries an XML encoding declaration
+    return _XML_DECL_RE.sub('', text, count=1)
+
+
+def parse_html(resp):
+    """Parse an HTML response with lxml using the encoding the server or page declares."""
+    try:
+        return lxml.html.fromstring(decode_html(resp.content, header_charset(resp)))
+    except lxml.etree.ParserError:
+        # Empty (or comment-only) bodies raise 'Document is empty'; treat them as a page without links
+        return lxml.html.fromstring('<html></html>')
 
 
 def extract_citation_links(article_url):
-    """Return a list of lists of external links for each citation in the Grokipedia article."""
-    resp = requests.get(article_url, timeout=15)
+    """Return the external links of every citation in the Grokipedia article.
+
+    Links are returned as two parallel arrays: flat_urls in citation order, and
+    owners, where owners[i] is the citation number (from 1) that flat_urls[i]
+    belongs to. citation_count also counts citations whose footnote has no links.
+    """
+    resp = SESSION.get(article_url, timeout=15)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    citation_refs = []
-    # Find citation markers (<sup> tags referencing footnotes)
-    for sup in soup.find_all('sup'):
-        a = sup.find('a')
-        if not a or not a.get('href'):
-            continue
-        href = a['href']
+    root = parse_html(resp)
+    flat_urls = []
+    owners = array('i')
+    citation_count = 0
+    # Find citation markers (first anchor inside each <sup> referencing a footnote)
+    for a in root.xpath("//sup/descendant::a[1][@href != '']"):
+        href = a.get('href')
         if href.startswith('#'):
-            footnote = soup.find(id=href[1:])
-            if not footnote:
+            footnote = root.get_element_by_id(href[1:], None)
+            if footnote is None:
                 continue
-            links = []
-            for link in footnote.find_all('a', href=True):
-                full_url = urljoin(article_url, link['href'])
-                if full_url.startswith('http'):
-                    links.append(full_url)
-            citation_refs.append(links)
+            citation_count += 1
+            # The same URL is often linked more than once inside one footnote
+            seen = set()
+            for link in footnote.xpath('.//a[@href]'):
+                full_url = urljoin(article_url, link.get('href'))
+                if full_url.startswith('http') and full_url not in seen:
+                    seen.add(full_url)
+                    flat_urls.append(full_url)
+                    owners.append(citation_count)
         else:
-            citation_refs.append([urljoin(article_url, href)])
+            citation_count += 1
+            flat_urls.append(urljoin(article_url, href))
+            owners.append(citation_count)
     # Fallback: if no citations were found, collect all external links
-    if not citation_refs:
+    if not citation_count:
         links = []
-        for link in soup.find_all('a', href=True):
-            full_url = urljoin(article_url, link['href'])
+        for link in root.xpath('//a[@href]'):
+            full_url = urljoin(article_url, link.get('href'))
             if full_url.startswith('http'):
                 links.append(full_url)
-        citation_refs = [[url] for url in links]
-    return citation_refs
+        flat_urls = links
+        citation_count = len(flat_urls)
+        owners = array('i', range(1, citation_count + 1))
+    return flat_urls, owners, citation_count
 
 
 def get_domain(url):
-    parsed = urlparse(url)
-    return parsed.netloc.lower()
+    m = _DOMAIN_RE.match(url)
+    return m.group(1).lower() if m else ''
 
 
-def analyze_dependencies(citation_refs):
-    """Return mapping of citation index to its source domain(s) and overall grouping."""
-    citation_sources = {}
-    for idx, links in enumerate(citation_refs, start=1):
-        domains = [get_domain(link) for link in links]
-        citation_sources[idx] = domains
+def analyze_dependencies(flat_urls, owners, citation_count):
+    """Return mapping of citation index to its set of source domains and overall grouping."""
+    citation_sources = {idx: set() for idx in range(1, citation_count + 1)}
     domain_to_citations = collections.defaultdict(list)
-    for cit_idx, domains in citation_sources.items():
-        for d in set(domains):
-            domain_to_citations[d].append(cit_idx)
+    domains = [get_domain(url) for url in flat_urls]
+    for url_i, d in enumerate(domains):
+        # Dedupe on insertion: a publisher cited twice in one footnote counts once
+        cit_domains = citation_sources[owners[url_i]]
+        if d not in cit_domains:
+            cit_domains.add(d)
+            domain_to_citations[d].append(owners[url_i])
     return citation_sources, domain_to_citations
 
 
@@ -83,11 +159,11 @@ def main():
             sys.exit(1)
     else:
         article_url = sys.argv[1]
-    citation_refs = extract_citation_links(article_url)
-    citation_sources, domain_to_citations = analyze_dependencies(citation_refs)
+    flat_urls, owners, citation_count = extract_citation_links(article_url)
+    citation_sources, domain_to_citations = analyze_dependencies(flat_urls, owners, citation_count)
     print("Citation sources by citation number:")
     for i in sorted(citation_sources):
-        print(f"  Citation [{i}]: {citation_sources[i]}")
+        print(f"  Citation [{i}]: {sorted(citation_sources[i])}")
     print("\nUnique sources and which citations they appear in:")
     for domain, cites in domain_to_citations.items():
         print(f"  {domain}: cited in {cites}")
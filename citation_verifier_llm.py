@@ -4,9 +4,11 @@ citation_verifier_llm.py (small model version)
 
 This script analyses citations in a Grokipedia article and attempts to identify
 whether multiple citations ultimately refer to the same original source.
-It uses an open-source language model from Hugging Face (defaulting to the
-lightweight `google/flan-t5-small`) to read each cited article and answer
-which news outlet or wire service is credited.
+Each cited article is first scanned for the names of known news outlets and
+wire services; articles that mention none of them are passed to an open-source
+language model from Hugging Face (defaulting to the lightweight
+`google/flan-t5-small`), which is asked which news outlet or wire service is
+credited.
 
 Usage:
     python citation_verifier_llm.py https://grokipedia.com/page/SomePage
@@ -14,92 +16,735 @@ Usage:
 If no URL argument is provided, the script will prompt you to enter a Grokipedia URL.
 
 Dependencies:
-    pip install requests beautifulsoup4 transformers torch
+    pip install requests aiohttp lxml transformers torch
+    pip install pyahocorasick  # optional, faster outlet name matching
+    pip install selectolax  # optional, faster paragraph extraction
+    pip install optimum[onnxruntime]  # optional, faster CPU inference
 
 Notes:
     - The default model (flan-t5-small) is much smaller (~250MB) than flan-t5-base,
       so it downloads faster and requires less memory. You can change the model
       name by editing the load_llm() function or passing a different value when
       calling it.
+    - On a CUDA GPU with bitsandbytes and accelerate installed
+      (pip install bitsandbytes accelerate) the model is loaded with int8 weights;
+      pass quantize="bf16" to load_llm() for bfloat16 weights on CPU, or
+      quantize=None for full precision.
+    - Without a GPU, the model runs on ONNX Runtime when optimum[onnxruntime] is
+      installed, with weights dynamically quantized to int8. The first run exports
+      and quantizes the model into ~/.cache/grokipedia_onnx/; later runs load the
+      export directly. Passing an explicit quantize value keeps PyTorch.
     - On first run, the model weights will be downloaded and cached locally.
       Subsequent runs reuse the cached weights.
+    - The text of each fetched article is cached under ~/.cache/grokipedia/ for a
+      day, so re-running on the same page skips downloading and parsing it again.
+      Blocked or error pages are not cached. Delete that directory to force a refresh.
 """
+import os
+import re
 import sys
+import json
+import time
+import codecs
+import shutil
+import platform
+import atexit
+import asyncio
+import hashlib
+import tempfile
+import importlib.util
+import collections
 from urllib.parse import urljoin
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.etree
+import lxml.html
 
 try:
-    from transformers import pipeline
+    from selectolax.lexbor import LexborHTMLParser
 except ImportError:
-    pipeline = None  # Handle missing transformers gracefully
+    LexborHTMLParser = None  # Fall back to lxml for paragraph extraction
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None  # Fall back to a compiled regex for outlet matching
+
+try:
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, BitsAndBytesConfig
+except ImportError:
+    AutoModelForSeq2SeqLM = None  # Handle missing transformers gracefully
+
+try:
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ORTModelForSeq2SeqLM = None  # ONNX Runtime backend is optional
+
+USER_AGENT = "grokipedia-citation-analyzer"
+
+# Shared session so connections to the same host are reused across requests
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.3))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers["User-Agent"] = USER_AGENT
+
+# charset declared by <meta charset=...> or <meta http-equiv=... content="...; charset=...">
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_.:-]+)', re.I)
+XML_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+# Known outlets and wire services as (alias, canonical name); matched before asking the LLM
+OUTLETS = [
+    ("reuters", "reuters"),
+    ("thomson reuters", "reuters"),
+    ("associated press", "associated press"),
+    ("(ap)", "associated press"),
+    ("ap news", "associated press"),
+    ("ap photo", "associated press"),
+    ("agence france-presse", "afp"),
+    ("agence france presse", "afp"),
+    ("afp", "afp"),
+    ("united press international", "upi"),
+    ("bloomberg news", "bloomberg"),
+    ("deutsche presse-agentur", "dpa"),
+    ("dpa", "dpa"),
+    ("xinhua", "xinhua"),
+    ("tass", "tass"),
+    ("ria novosti", "ria novosti"),
+    ("interfax", "interfax"),
+    ("kyodo news", "kyodo news"),
+    ("yonhap", "yonhap"),
+    ("press trust of india", "press trust of india"),
+    ("agencia efe", "efe"),
+    ("ansa", "ansa"),
+    ("anadolu agency", "anadolu agency"),
+    ("pa media", "pa media"),
+    ("australian associated press", "australian associated press"),
+    ("the canadian press", "the canadian press"),
+    ("bbc", "bbc"),
+    ("bbc news", "bbc"),
+    ("cnn", "cnn"),
+    ("nbc news", "nbc news"),
+    ("abc news", "abc news"),
+    ("cbs news", "cbs news"),
+    ("fox news", "fox news"),
+    ("cnbc", "cnbc"),
+    ("msnbc", "msnbc"),
+    ("npr", "npr"),
+    ("national public radio", "npr"),
+    ("pbs newshour", "pbs"),
+    ("sky news", "sky news"),
+    ("al jazeera", "al jazeera"),
+    ("deutsche welle", "deutsche welle"),
+    ("france 24", "france 24"),
+    ("euronews", "euronews"),
+    ("the new york times", "the new york times"),
+    ("new york times", "the new york times"),
+    ("the washington post", "the washington post"),
+    ("washington post", "the washington post"),
+    ("the wall street journal", "the wall street journal"),
+    ("wall street journal", "the wall street journal"),
+    ("usa today", "usa today"),
+    ("los angeles times", "los angeles times"),
+    ("financial times", "financial times"),
+    ("daily mail", "daily mail"),
+    ("politico", "politico"),
+    ("axios", "axios"),
+    ("business insider", "business insider"),
+    ("time magazine", "time"),
+    ("newsweek", "newsweek"),
+    ("techcrunch", "techcrunch"),
+    ("ars technica", "ars technica"),
+    ("the times of india", "the times of india"),
+    ("south china morning post", "south china morning post"),
+    ("the japan times", "the japan times"),
+    ("the sydney morning herald", "the sydney morning herald"),
+]
+
+# Outlets whose names are also ordinary phrases or people ("the independent review",
+# "on the verge of", Michael Bloomberg); they only count in an attribution context
+AMBIGUOUS_OUTLETS = [
+    ("bloomberg", "bloomberg"),
+    ("dow jones", "dow jones"),
+    ("press association", "pa media"),
+    ("the guardian", "the guardian"),
+    ("the telegraph", "the telegraph"),
+    ("the independent", "the independent"),
+    ("the economist", "the economist"),
+    ("the hill", "the hill"),
+    ("forbes", "forbes"),
+    ("the atlantic", "the atlantic"),
+    ("the new yorker", "the new yorker"),
+    ("the verge", "the verge"),
+    ("wired", "wired"),
+]
+ATTRIBUTION_CONTEXTS = ("according to {}", "told {}", "({})", "{} reported", "reported by {}")
+OUTLETS += [(ctx.format(name), canonical) for name, canonical in AMBIGUOUS_OUTLETS for ctx in ATTRIBUTION_CONTEXTS]
+
+def build_outlet_matcher(outlets):
+    """Compile the outlet aliases into an Aho-Corasick automaton (or a regex without pyahocorasick)."""
+    if ahocorasick is None:
+        # Longest alias first, so the regex prefers it at each position like match_outlet() does
+        aliases = sorted((alias for alias, _ in outlets), key=len, reverse=True)
+        return re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, aliases)) + r")(?!\w)")
+    automaton = ahocorasick.Automaton()
+    for alias, canonical in outlets:
+        automaton.add_word(alias, (canonical, len(alias)))
+    automaton.make_automaton()
+    return automaton
+
+OUTLET_MATCHER = build_outlet_matcher(OUTLETS)
+OUTLET_NAMES = dict(OUTLETS)
+
+# Fixed instruction placed before every article; tokenized once in load_llm()
+PROMPT_PREFIX = (
+    "Identify the news outlet or wire service credited as the original source in the following article. "
+    "If there is no explicit attribution to another outlet or wire service, respond with 'none'. "
+    "Article:"
+)
+# Characters of article text included in each prompt (roughly the model's 512-token window)
+MAX_PROMPT_CHARS = 2000
+MAX_INPUT_TOKENS = 512
+
+# Loaded model, its name, its tokenizer and the token ids of PROMPT_PREFIX
+SourceModel = collections.namedtuple("SourceModel", ["model", "name", "tokenizer", "prefix_ids"])
+
+# Texts shorter than this are error pages or login walls, not articles
+MIN_ARTICLE_CHARS = 200
+# Boilerplate that marks a blocked or broken page when the text is otherwise short
+JUNK_PHRASES = (
+    "enable javascript",
+    "403 forbidden",
+    "access denied",
+    "subscribe to continue",
+    "page not found",
+    "are you a robot",
+)
+JUNK_PAGE_CHARS = 1000
+
+# LLM answers keyed by article fingerprint, persisted between runs
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "grokipedia_llm.json")
+CACHE = {}
+# Oldest entries are evicted beyond this many answers
+MAX_CACHE_ENTRIES = 5000
+# Shingle fingerprints of cached articles, for matching near-duplicate wire copy,
+# and an inverted index from shingle hash to the cache keys containing it
+SHINGLES = {}
+SHINGLE_INDEX = collections.defaultdict(set)
+FINGERPRINT_SCHEME = "bottom-k"
+SHINGLE_SIZE = 3
+SHINGLE_COUNT = 32
+SIMILARITY_THRESHOLD = 0.9
+
+# Per-socket limits, so time spent queued for a free connection in the pool is not counted
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=15)
+FETCH_RETRIES = 2
+FETCH_BACKOFF = 0.3
+
+# Only the start of each cited page is downloaded; attribution lives in the lead paragraphs
+MAX_ARTICLE_BYTES = 512 * 1024
+
+# Extracted paragraph text of fetched articles, one file per URL
+TEXT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "grokipedia")
+TEXT_CACHE_TTL = 24 * 60 * 60
+# ONNX exports of the model, so the export only happens on the first run
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "grokipedia_onnx")
+# Files an encoder-decoder export contains; each is quantized to <name>_quantized.onnx
+ONNX_FILES = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+
+def header_charset(resp):
+    """Return the charset declared in a requests response's Content-Type header, or None."""
+    # resp.encoding falls back to ISO-8859-1 for text/* without a charset (RFC 2616),
+    # which would override the page's own <meta charset>, so only trust it when declared
+    if "charset=" in resp.headers.get("Content-Type", "").lower():
+        return resp.encoding
+    return None
+
+def document_charset(body, declared=None):
+    """Pick the encoding of an HTML body: the header charset, then <meta charset>, then UTF-8."""
+    candidates = [declared]
+    m = META_CHARSET_RE.search(body[:2048])
+    if m:
+        candidates.append(m.group(1).decode("ascii"))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+def decode_html(body, declared=None):
+    """Decode an HTML body to str using the encoding the server or page declares."""
+    # Decode in Python: libxml2 doesn't know several of Python's codec names (euc_kr, mac-roman, ...)
+    text = body.decode(document_charset(body, declared), errors="replace")
+    # lxml refuses str input that still carries an XML encoding declaration
+    return XML_DECL_RE.sub("", text, count=1)
+
+def parse_html(body, declared=None):
+    """Parse an HTML body with lxml using the encoding the server or page declares."""
+    try:
+        return lxml.html.fromstring(decode_html(body, declared))
+    except lxml.etree.ParserError:
+        # Empty (or comment-only) bodies raise 'Document is empty'; treat them as a page without links
+        return lxml.html.fromstring("<html></html>")
 
 def extract_citation_links(article_url):
     """Extract citation links from a Grokipedia article."""
-    resp = requests.get(article_url, timeout=15)
+    resp = SESSION.get(article_url, timeout=15)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    root = parse_html(resp.content, header_charset(resp))
     citation_refs = []
-    # Extract from <sup> markers
-    for sup in soup.find_all('sup'):
-        a = sup.find('a')
-        if not a or not a.get('href'):
-            continue
-        href = a['href']
+    # Extract from <sup> markers (first anchor inside each one)
+    for a in root.xpath("//sup/descendant::a[1][@href != '']"):
+        href = a.get('href')
         if href.startswith('#'):
-            footnote = soup.find(id=href[1:])
-            if not footnote:
+            footnote = root.get_element_by_id(href[1:], None)
+            if footnote is None:
                 continue
             links = []
-            for link in footnote.find_all('a', href=True):
-                full_url = urljoin(article_url, link['href'])
+            for link in footnote.xpath('.//a[@href]'):
+                full_url = urljoin(article_url, link.get('href'))
                 if full_url.startswith('http'):
                     links.append(full_url)
-            citation_refs.append(links)
+            # The same URL is often linked more than once inside one footnote
+            citation_refs.append(list(dict.fromkeys(links)))
         else:
             citation_refs.append([urljoin(article_url, href)])
     # Fallback: collect all external links if no citations found
     if not citation_refs:
         links = []
-        for link in soup.find_all('a', href=True):
-            full_url = urljoin(article_url, link['href'])
+        for link in root.xpath('//a[@href]'):
+            full_url = urljoin(article_url, link.get('href'))
             if full_url.startswith('http'):
                 links.append(full_url)
-        citation_refs = [[url] for url in links]
+        citation_refs = [[url] for url in dict.fromkeys(links)]
     return citation_refs
 
+def parse_article_text(html, charset=None):
+    """Return the text of an HTML document by concatenating its paragraph elements.
+
+    charset is the encoding from the HTTP header, if any; otherwise it is taken from
+    the document's <meta charset>, defaulting to UTF-8. Both parser backends yield the
+    same text, so the text cache and the LLM cache keys don't depend on which one is used.
+    """
+    # Text fragments are joined with a space so element boundaries such as <br> don't
+    # glue words together ("(AP)<br>The" -> "(AP) The"); whitespace is collapsed after
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(decode_html(html, charset))
+        paragraphs = (p.text(separator=" ") for p in tree.css("p"))
+    else:
+        try:
+            root = parse_html(html, charset)
+        except Exception:
+            return ""
+        paragraphs = (" ".join(p.itertext()) for p in root.iter('p'))
+    return " ".join(" ".join(paragraphs).split())
+
+def text_cache_path(url):
+    """Return the on-disk cache file holding the extracted text of a URL."""
+    return os.path.join(TEXT_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".txt")
+
+def write_atomic(path, data):
+    """Write text to path via a temporary file, so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_cached_text(url):
+    """Return previously extracted text for a URL, or None if it is not cached or has expired."""
+    path = text_cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > TEXT_CACHE_TTL:
+            return None
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, ValueError):
+        return None
+    # Entries written before blocked pages were filtered out are refetched, not trusted
+    if is_junk_text(text):
+        return None
+    return text
+
+def store_cached_text(url, text):
+    """Save the extracted text of a URL; failed fetches and blocked or error pages are not cached."""
+    if not text or is_junk_text(text):
+        return
+    try:
+        write_atomic(text_cache_path(url), text)
+    except (OSError, ValueError):
+        pass
+
 def fetch_article_text(url):
     """Fetch article text by concatenating paragraph elements."""
+    text = load_cached_text(url)
+    if text is not None:
+        return text
     try:
-        resp = requests.get(url, timeout=15)
-        resp.raise_for_status()
+        with SESSION.get(url, timeout=15, stream=True) as resp:
+            resp.raise_for_status()
+            body = resp.raw.read(MAX_ARTICLE_BYTES, decode_content=True)
+            charset = header_charset(resp)
     except Exception:
         return ""
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    paragraphs = soup.find_all('p')
-    return " ".join(p.get_text(separator=" ", strip=True) for p in paragraphs).strip()
+    text = parse_article_text(body, charset)
+    store_cached_text(url, text)
+    return text
+
+async def fetch(session, url):
+    """Fetch up to MAX_ARTICLE_BYTES of a URL's body and its header charset using a shared aiohttp session.
+
+    Connection errors and timeouts are retried like the Retry(total=2) on SESSION.
+    """
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            return await fetch_once(session, url)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == FETCH_RETRIES:
+                raise
+            await asyncio.sleep(FETCH_BACKOFF * 2 ** attempt)
+
+async def fetch_once(session, url):
+    """Make a single attempt at fetching a URL for fetch()."""
+    async with session.get(url, timeout=FETCH_TIMEOUT) as r:
+        r.raise_for_status()
+        body = bytearray()
+        while len(body) < MAX_ARTICLE_BYTES:
+            chunk = await r.content.read(MAX_ARTICLE_BYTES - len(body))
+            if not chunk:
+                break
+            body += chunk
+        return bytes(body), r.charset
+
+async def gather_all(urls):
+    """Fetch all URLs concurrently; failed requests are returned as exceptions."""
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=20), headers={"User-Agent": USER_AGENT}
+    ) as s:
+        return await asyncio.gather(*(fetch(s, u) for u in urls), return_exceptions=True)
+
+def fetch_article_texts(urls):
+    """Fetch and parse many articles concurrently, returning their texts in order."""
+    texts = {url: load_cached_text(url) for url in urls}
+    # Only hit the network for URLs that are not in the on-disk cache
+    missing = [url for url, text in texts.items() if text is None]
+    if missing:
+        for url, result in zip(missing, asyncio.run(gather_all(missing))):
+            text = "" if isinstance(result, BaseException) else parse_article_text(*result)
+            store_cached_text(url, text)
+            texts[url] = text
+    return [texts[url] for url in urls]
 
-def load_llm(model_name="google/flan-t5-small"):
-    """Load a text-generation pipeline from transformers with a specified model."""
-    if pipeline is None:
+def export_onnx_model(model_name, export_dir):
+    """Export the model to ONNX with dynamic int8 weights, publishing export_dir only once complete."""
+    os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=ONNX_CACHE_DIR, prefix=".export-")
+    try:
+        ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True).save_pretrained(tmp_dir)
+        if platform.machine().lower() in ("arm64", "aarch64"):
+            qconfig = AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+        else:
+            qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        for file_name in ONNX_FILES:
+            quantizer = ORTQuantizer.from_pretrained(tmp_dir, file_name=file_name)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+        # A crashed export leaves only the temporary directory behind, never a half-written export_dir
+        os.replace(tmp_dir, export_dir)
+    except OSError:
+        # Another run finished the same export first; use theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(export_dir):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def load_onnx_model(model_name):
+    """Load an int8 ONNX Runtime export of the model for CPU inference, exporting it on first use."""
+    export_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "--") + "--int8")
+    if not os.path.isdir(export_dir):
+        export_onnx_model(model_name, export_dir)
+    encoder, decoder, decoder_with_past = (name.replace(".onnx", "_quantized.onnx") for name in ONNX_FILES)
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        export_dir,
+        provider="CPUExecutionProvider",
+        encoder_file_name=encoder,
+        decoder_file_name=decoder,
+        decoder_with_past_file_name=decoder_with_past,
+    )
+
+def load_llm(model_name="google/flan-t5-small", quantize="auto", backend="auto"):
+    """Load a seq2seq model and tokenizer from transformers with a specified model.
+
+    backend selects the runtime: "onnx" (ONNX Runtime on CPU with int8 weights,
+    needs optimum[onnxruntime]), "torch" for PyTorch, or "auto" to use ONNX Runtime
+    when it is installed, no GPU is available and quantize is left at "auto".
+
+    quantize selects the PyTorch weight format: "int8" (bitsandbytes and accelerate,
+    needs a CUDA GPU), "bf16" (halves memory traffic on CPUs with native bfloat16
+    support), None for full fp32, or "auto" to use int8 when a GPU, bitsandbytes and
+    accelerate are available. Any value other than "auto" selects the torch backend
+    and is rejected with backend="onnx".
+    """
+    if AutoModelForSeq2SeqLM is None:
         raise ImportError("transformers library is not installed. Run: pip install transformers torch")
-    return pipeline("text2text-generation", model=model_name)
+    if backend == "onnx" and quantize != "auto":
+        raise ValueError("quantize only applies to the torch backend; the onnx backend always uses int8 weights")
+    if backend == "auto":
+        # An explicit weight format asks for PyTorch, so don't swap in ONNX Runtime behind its back
+        use_onnx = quantize == "auto" and ORTModelForSeq2SeqLM is not None and not torch.cuda.is_available()
+        backend = "onnx" if use_onnx else "torch"
+    if backend == "onnx" and ORTModelForSeq2SeqLM is None:
+        raise ImportError("optimum is not installed. Run: pip install optimum[onnxruntime]")
+    if quantize == "auto":
+        # 8-bit loading and device_map="auto" both need accelerate as well as bitsandbytes
+        has_int8 = all(importlib.util.find_spec(mod) is not None for mod in ("bitsandbytes", "accelerate"))
+        quantize = "int8" if has_int8 and torch.cuda.is_available() else None
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        model = load_onnx_model(model_name)
+    elif quantize == "int8":
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name, quantization_config=BitsAndBytesConfig(load_in_8bit=True), device_map="auto"
+        )
+    elif quantize == "bf16":
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name, torch_dtype=torch.bfloat16)
+    else:
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    prefix_ids = tokenizer(PROMPT_PREFIX, add_special_tokens=False)["input_ids"]
+    return SourceModel(model, model_name, tokenizer, prefix_ids)
 
-def identify_source(text, llm):
-    """Use the LLM to identify the credited news outlet or wire service."""
-    if not text:
+def encode_prompts(texts, llm):
+    """Tokenize articles and prepend the cached prefix ids, returning one padded batch."""
+    # flan-t5 only sees 512 tokens anyway; don't make the tokenizer chew through the whole page.
+    # The article is truncated to whatever room the prefix leaves, so the instruction is never cut.
+    room = MAX_INPUT_TOKENS - len(llm.prefix_ids)
+    encoded = llm.tokenizer([text[:MAX_PROMPT_CHARS] for text in texts], truncation=True, max_length=room)
+    rows = [llm.prefix_ids + ids for ids in encoded["input_ids"]]
+    return llm.tokenizer.pad({"input_ids": rows}, return_tensors="pt")
+
+def generate_answers(texts, llm, batch_size=16):
+    """Run the model over articles in batches and return its decoded answers."""
+    answers = []
+    for start in range(0, len(texts), batch_size):
+        batch = encode_prompts(texts[start:start + batch_size], llm).to(llm.model.device)
+        output = llm.model.generate(**batch, max_length=50)
+        answers.extend(llm.tokenizer.batch_decode(output, skip_special_tokens=True))
+    return answers
+
+def is_junk_text(text):
+    """Return True if a fetched page is too short or too boilerplate to credit any source."""
+    if len(text) < MIN_ARTICLE_CHARS:
+        return True
+    # Long pages often carry a cookie or paywall notice next to real article text
+    if len(text) >= JUNK_PAGE_CHARS:
+        return False
+    lowered = text.lower()
+    return any(phrase in lowered for phrase in JUNK_PHRASES)
+
+def is_word_char(ch):
+    """Return True for characters the regex fallback treats as \\w."""
+    return ch.isalnum() or ch == "_"
+
+def match_outlet(text):
+    """Return the known outlet mentioned most often in an article, or 'none'."""
+    text = text.lower()
+    hits = collections.Counter()
+    if ahocorasick is None:
+        hits.update(OUTLET_NAMES[m.group(0)] for m in OUTLET_MATCHER.finditer(text))
+    else:
+        # Keep only whole-word matches, so 'afp' does not fire inside another word, and
+        # only then take the longest one at each position, left to right without overlaps.
+        # This gives the same matches as the regex fallback.
+        matches = []
+        for end, (canonical, length) in OUTLET_MATCHER.iter(text):
+            start = end - length + 1
+            if start > 0 and is_word_char(text[start - 1]):
+                continue
+            if end + 1 < len(text) and is_word_char(text[end + 1]):
+                continue
+            matches.append((start, -length, canonical))
+        pos = 0
+        for start, neg_length, canonical in sorted(matches):
+            if start >= pos:
+                hits[canonical] += 1
+                pos = start - neg_length
+    if not hits:
         return "none"
-    prompt = (
-        "Identify the news outlet or wire service credited as the original source in the following article. "
-        "If there is no explicit attribution to another outlet or wire service, respond with 'none'. "
-        "Article: " + text
-    )
+    return hits.most_common(1)[0][0]
+
+def text_key(text):
+    """Return the exact-match cache key of an article's text."""
+    return hashlib.blake2b(text[:4096].encode(), digest_size=16).hexdigest()
+
+def text_shingles(text):
+    """Return the bottom-k MinHash fingerprint of an article: its SHINGLE_COUNT smallest shingle hashes.
+
+    Taking the smallest hashes rather than the first or most frequent shingles makes the
+    fingerprint independent of where text sits in the article, so wire copy behind a
+    different byline or dateline still matches.
+    """
+    words = [w for w in text.lower().split() if len(w) > 3]
+    hashes = {
+        hashlib.blake2b(" ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=8).hexdigest()
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+    # Fixed-width hex digests sort in the same order as their integer values
+    return frozenset(sorted(hashes)[:SHINGLE_COUNT])
+
+def cache_version(model_name):
+    """Return a tag for cached answers, so a different model, prompt or fingerprint starts a fresh cache."""
+    tag = "\0".join([model_name, PROMPT_PREFIX, FINGERPRINT_SCHEME, str(SHINGLE_SIZE), str(SHINGLE_COUNT)])
+    return hashlib.blake2b(tag.encode(), digest_size=16).hexdigest()
+
+def remember_source(key, shingles, answer):
+    """Add an answer to CACHE, evicting the least recently used entries beyond MAX_CACHE_ENTRIES."""
+    forget_source(key)
+    CACHE[key] = answer
+    # Only full fingerprints take part in fuzzy matching
+    if len(shingles) == SHINGLE_COUNT:
+        SHINGLES[key] = shingles
+        for h in shingles:
+            SHINGLE_INDEX[h].add(key)
+    while len(CACHE) > MAX_CACHE_ENTRIES:
+        forget_source(next(iter(CACHE)))
+
+def forget_source(key):
+    """Drop an answer and its fingerprint from the cache."""
+    CACHE.pop(key, None)
+    for h in SHINGLES.pop(key, ()):
+        keys = SHINGLE_INDEX[h]
+        keys.discard(key)
+        if not keys:
+            del SHINGLE_INDEX[h]
+
+def lookup_cached_source(key, shingles):
+    """Return the cached answer for an article or a near-duplicate of it, or None."""
+    if key in CACHE:
+        # Move the hit to the end so eviction drops the least recently used entries
+        CACHE[key] = CACHE.pop(key)
+        return CACHE[key]
+    other = find_near_duplicate(shingles, SHINGLE_INDEX, SHINGLES)
+    return None if other is None else CACHE.get(other)
+
+def find_near_duplicate(shingles, index, fingerprints):
+    """Return the key of the fingerprint most similar to shingles above SIMILARITY_THRESHOLD, or None.
+
+    index maps each shingle hash to the keys whose fingerprint contains it.
+    """
+    # Only trust fuzzy matches on full fingerprints; short texts share too little to compare
+    if len(shingles) < SHINGLE_COUNT:
+        return None
+    # Only articles sharing at least one shingle are candidates; the one sharing the
+    # most has the highest Jaccard similarity, since all fingerprints are the same size
+    overlaps = collections.Counter(k for h in shingles for k in index.get(h, ()))
+    if not overlaps:
+        return None
+    other, shared = overlaps.most_common(1)[0]
+    if shared / (len(shingles) + len(fingerprints[other]) - shared) > SIMILARITY_THRESHOLD:
+        return other
+    return None
+
+def load_cache(version, path=CACHE_PATH):
+    """Load previously identified sources from disk into CACHE, unless they came from another model or prompt."""
     try:
-        result = llm(prompt, max_length=50)[0]['generated_text']
-    except Exception:
-        return "none"
-    answer = result.strip().split("\n")[0]
-    return answer.lower()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    # The file sits at a shared path; anything not shaped like save_cache() output is a miss
+    if not isinstance(data, dict) or data.get("version") != version:
+        return
+    answers = data.get("answers")
+    shingles = data.get("shingles", {})
+    if not isinstance(answers, dict) or not isinstance(shingles, dict):
+        return
+    for key, answer in answers.items():
+        fingerprint = shingles.get(key, [])
+        if not isinstance(answer, str) or not isinstance(fingerprint, list):
+            continue
+        if not all(isinstance(h, str) for h in fingerprint):
+            continue
+        remember_source(key, frozenset(fingerprint), answer)
+
+def save_cache(version, path=CACHE_PATH):
+    """Persist CACHE to disk so later runs can skip the LLM for known articles."""
+    data = {
+        "version": version,
+        "answers": CACHE,
+        "shingles": {k: sorted(v) for k, v in SHINGLES.items()},
+    }
+    try:
+        write_atomic(path, json.dumps(data))
+    except OSError:
+        pass
+
+def identify_sources(texts, llm, batch_size=16):
+    """Use the LLM to identify the credited outlet for many articles in batched forward passes."""
+    answers = ["none"] * len(texts)
+    # Group articles by fingerprint so each distinct text reaches the model at most once;
+    # near-duplicates within this call are grouped too, through their own shingle index
+    pending = {}
+    pending_shingles = {}
+    pending_index = collections.defaultdict(set)
+    for i, text in enumerate(texts):
+        if not text or is_junk_text(text):
+            continue
+        # A plain string scan settles most articles; the LLM only sees the rest
+        outlet = match_outlet(text)
+        if outlet != "none":
+            answers[i] = outlet
+            continue
+        key = text_key(text)
+        if key in pending:
+            pending[key][1].append(i)
+            continue
+        shingles = text_shingles(text)
+        cached = lookup_cached_source(key, shingles)
+        if cached is not None:
+            answers[i] = cached
+            continue
+        other = find_near_duplicate(shingles, pending_index, pending_shingles)
+        if other is not None:
+            pending[other][1].append(i)
+            continue
+        pending[key] = (shingles, [i])
+        if len(shingles) == SHINGLE_COUNT:
+            pending_shingles[key] = shingles
+            for h in shingles:
+                pending_index[h].add(key)
+    if not pending:
+        return answers
+    items = list(pending.items())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        try:
+            results = generate_answers([texts[indices[0]] for _, (_, indices) in batch], llm, batch_size)
+        except Exception:
+            # Only this batch stays 'none'; answers from the other batches are kept and cached
+            continue
+        for (key, (shingles, indices)), result in zip(batch, results):
+            answer = result.strip().split("\n")[0].lower()
+            remember_source(key, shingles, answer)
+            for i in indices:
+                answers[i] = answer
+    return answers
+
+def identify_source(text, llm):
+    """Use the LLM to identify the credited news outlet or wire service."""
+    return identify_sources([text], llm)[0]
 
 def main():
     article_url = sys.argv[1] if len(sys.argv) > 1 else input("Enter the Grokipedia article URL: ").strip()
@@ -112,15 +757,14 @@ def main():
     except ImportError as e:
         print(str(e))
         return
-    citation_sources = []
-    for citation_links in citations:
-        if not citation_links:
-            citation_sources.append("none")
-            continue
-        url = citation_links[0]
-        text = fetch_article_text(url)
-        src = identify_source(text, llm)
-        citation_sources.append(src)
+    version = cache_version(llm.name)
+    load_cache(version)
+    atexit.register(save_cache, version)
+    # Fetch the first link of every citation concurrently, then run the LLM over them in batches.
+    # Citations backed by the same URL are only fetched and identified once.
+    urls = list(dict.fromkeys(c[0] for c in citations if c))
+    url_to_source = dict(zip(urls, identify_sources(fetch_article_texts(urls), llm)))
+    citation_sources = [url_to_source[c[0]] if c else "none" for c in citations]
     source_map = {}
     for idx, src in enumerate(citation_sources, start=1):
         source_map.setdefault(src, []).append(idx)